@@ -1,56 +1,81 @@
 import os
 import sqlite3
-import json
+import ijson
 from glob import glob
+from multiprocessing import Pool
 
 DB_PATH = "ipl.db"
 DATA_DIR = "data"
 
-# Connect to SQLite DB
-conn = sqlite3.connect(DB_PATH)
-cursor = conn.cursor()
-
-# Create tables
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS matches (
-    id TEXT PRIMARY KEY,
-    date TEXT,
-    city TEXT,
-    venue TEXT,
-    team1 TEXT,
-    team2 TEXT,
-    toss_winner TEXT,
-    toss_decision TEXT,
-    winner TEXT,
-    result TEXT,
-    margin TEXT
-)
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS deliveries (
-    match_id TEXT,
-    inning INTEGER,
-    batting_team TEXT,
-    bowling_team TEXT,
-    over INTEGER,
-    ball INTEGER,
-    batsman TEXT,
-    non_striker TEXT,
-    bowler TEXT,
-    runs_batsman INTEGER,
-    runs_extras INTEGER,
-    runs_total INTEGER,
-    dismissal_kind TEXT,
-    player_dismissed TEXT
-)
-""")
+def stream_match(f):
+    """Stream a match file, yielding ("info", info) and
+    ("ball", inning_number, batting_team, over, delivery) items.
+    JSON objects are unordered, so each over's deliveries are held until the
+    over object closes and each innings' until the innings closes, by which
+    point the over number and batting team have been seen wherever they sit."""
+    inning_number = 0
+    batting_team = None
+    over = None
+    inning_balls = []
+    over_balls = []
+    builder = None
+    building = None
+
+    for prefix, event, value in ijson.parse(f, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == building and event == "end_map":
+                if building == "info":
+                    yield "info", builder.value
+                else:
+                    over_balls.append(builder.value)
+                builder = None
+            continue
+
+        if event == "start_map" and (prefix == "info" or prefix.endswith(".deliveries.item")):
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            building = prefix
+        elif prefix == "innings.item" and event == "start_map":
+            inning_number += 1
+            batting_team = None
+            inning_balls = []
+        elif prefix == "innings.item" and event == "end_map":
+            if inning_balls and batting_team is None:
+                raise ValueError(f"innings {inning_number} has deliveries but no batting team")
+            for over, delivery in inning_balls:
+                yield "ball", inning_number, batting_team, over, delivery
+        elif prefix == "innings.item.team" or (
+            # Older files key each innings by name: {"1st innings": {"team": ...}}
+            prefix.startswith("innings.item.") and prefix.count(".") == 3 and prefix.endswith(".team")
+        ):
+            batting_team = value
+        elif prefix.endswith(".overs.item") and event == "start_map":
+            over = None
+            over_balls = []
+        elif prefix.endswith(".overs.item") and event == "end_map":
+            if over_balls and over is None:
+                raise ValueError(f"an over in innings {inning_number} has deliveries but no over number")
+            inning_balls.extend((over, delivery) for delivery in over_balls)
+        elif prefix.endswith(".overs.item.over"):
+            over = value
 
 def parse_match(filepath):
-    with open(filepath, 'r') as f:
-        data = json.load(f)
+    """Parse one match file into its match row and delivery rows.
+    Runs in worker processes, so it must not touch the database."""
+    info = None
+    deliveries = []
+    with open(filepath, 'rb') as f:
+        for item in stream_match(f):
+            if item[0] == "info":
+                info = item[1]
+            else:
+                deliveries.append(item[1:])
+    if not isinstance(info, dict):
+        raise ValueError(f"{filepath} has no info object")
+    return build_match(filepath, info, deliveries)
 
-    info = data.get("info", {})
+def build_match(filepath, info, deliveries):
     match_id = os.path.splitext(os.path.basename(filepath))[0]
     date = info["dates"][0]
     city = info.get("city", "")
@@ -72,61 +97,267 @@ def parse_match(filepath):
         elif "wickets" in outcome["by"]:
             margin = f"{outcome['by']['wickets']} wickets"
 
-    # Insert match record
+    match_row = (match_id, date, city, venue, team1, team2, toss_winner, toss_decision, winner, result, margin)
+
+    # Deliveries arrive grouped by inning and over, so the ball number is a
+    # running count that restarts whenever the (inning, over) pair changes
+    current_over = None
+    ball = 0
+    rows = []
+    for inning_number, batting_team, over, delivery in deliveries:
+        batsman = delivery.get("batter")
+        non_striker = delivery.get("non_striker")
+        bowler = delivery.get("bowler")
+        bowling_team = delivery.get("team", "")
+        runs = delivery.get("runs", {})
+        runs_batsman = runs.get("batter", 0)
+        runs_extras = runs.get("extras", 0)
+        runs_total = runs.get("total", 0)
+        dismissal_kind = ""
+        player_dismissed = ""
+
+        if "wickets" in delivery:
+            wicket_info = delivery["wickets"][0]
+            dismissal_kind = wicket_info.get("kind", "")
+            player_dismissed = wicket_info.get("player_out", "")
+
+        if (inning_number, over) != current_over:
+            current_over = (inning_number, over)
+            ball = 0
+        ball += 1
+
+        rows.append((
+            match_id, inning_number, batting_team, team2 if batting_team == team1 else team1,
+            over, ball, batsman, non_striker, bowler,
+            runs_batsman, runs_extras, runs_total,
+            dismissal_kind, player_dismissed
+        ))
+
+    return match_row, rows
+
+def intern_name(cursor, table, ids, name):
+    """Return the integer key for a team or player name, adding it on first sight"""
+    if not name:
+        return None
+    key = ids.get(name)
+    if key is None:
+        # Names are unique case-insensitively, so a case variant of a stored
+        # name is ignored here and resolves to the existing row's id
+        cursor.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+        key = cursor.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()[0]
+        ids[name] = key
+    return key
+
+def insert_match(cursor, match_row, rows, team_ids, player_ids):
     cursor.execute("""
     INSERT OR REPLACE INTO matches
     (id, date, city, venue, team1, team2, toss_winner, toss_decision, winner, result, margin)
     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (match_id, date, city, venue, team1, team2, toss_winner, toss_decision, winner, result, margin))
-
-    # Deliveries
-    innings = data.get("innings", [])
-    for inning_number, inning in enumerate(innings, start=1):
-        for inning_name, inning_data in inning.items():
-            batting_team = inning_data["team"]
-            for over_data in inning_data["overs"]:
-                over = over_data["over"]
-                for delivery in over_data["deliveries"]:
-                    batsman = delivery.get("batter")
-                    non_striker = delivery.get("non_striker")
-                    bowler = delivery.get("bowler")
-                    bowling_team = delivery.get("team", "")
-                    runs = delivery.get("runs", {})
-                    runs_batsman = runs.get("batter", 0)
-                    runs_extras = runs.get("extras", 0)
-                    runs_total = runs.get("total", 0)
-                    dismissal_kind = ""
-                    player_dismissed = ""
-
-                    if "wickets" in delivery:
-                        wicket_info = delivery["wickets"][0]
-                        dismissal_kind = wicket_info.get("kind", "")
-                        player_dismissed = wicket_info.get("player_out", "")
-
-                    ball = len(cursor.execute("SELECT * FROM deliveries WHERE match_id=? AND inning=? AND over=?",
-                                              (match_id, inning_number, over)).fetchall()) + 1
-
-                    cursor.execute("""
-                    INSERT INTO deliveries (
-                        match_id, inning, batting_team, bowling_team,
-                        over, ball, batsman, non_striker, bowler,
-                        runs_batsman, runs_extras, runs_total,
-                        dismissal_kind, player_dismissed
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        match_id, inning_number, batting_team, team2 if batting_team == team1 else team1,
-                        over, ball, batsman, non_striker, bowler,
-                        runs_batsman, runs_extras, runs_total,
-                        dismissal_kind, player_dismissed
-                    ))
-
-# Load all JSONs in /data/
-json_files = glob(os.path.join(DATA_DIR, "*.json"))
-for file_path in json_files:
-    print(f"Loading: {file_path}")
-    parse_match(file_path)
-
-conn.commit()
-conn.close()
-print("✅ All matches loaded into ipl.db")
+    """, match_row)
+    intern_name(cursor, "teams", team_ids, match_row[4])
+    intern_name(cursor, "teams", team_ids, match_row[5])
+
+    # Store deliveries with integer team/player keys instead of repeated names
+    id_rows = [(
+        match_id, inning,
+        intern_name(cursor, "teams", team_ids, batting_team),
+        intern_name(cursor, "teams", team_ids, bowling_team),
+        over, ball,
+        intern_name(cursor, "players", player_ids, batsman),
+        intern_name(cursor, "players", player_ids, non_striker),
+        intern_name(cursor, "players", player_ids, bowler),
+        runs_batsman, runs_extras, runs_total,
+        dismissal_kind,
+        intern_name(cursor, "players", player_ids, player_dismissed)
+    ) for (
+        match_id, inning, batting_team, bowling_team,
+        over, ball, batsman, non_striker, bowler,
+        runs_batsman, runs_extras, runs_total,
+        dismissal_kind, player_dismissed
+    ) in rows]
+
+    # A rerun replaces the match row above, so clear its old deliveries too
+    # rather than appending a second copy that the summary tables would count
+    cursor.execute("DELETE FROM deliveries WHERE match_id = ?", (match_row[0],))
+    cursor.executemany("""
+    INSERT INTO deliveries (
+        match_id, inning, batting_team_id, bowling_team_id,
+        over, ball, batsman_id, non_striker_id, bowler_id,
+        runs_batsman, runs_extras, runs_total,
+        dismissal_kind, player_dismissed_id
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, id_rows)
+
+def main():
+    # Connect to SQLite DB
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    # Bulk-load friendly settings
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+
+    # Create tables
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS matches (
+        id TEXT PRIMARY KEY,
+        date TEXT,
+        city TEXT COLLATE NOCASE,
+        venue TEXT COLLATE NOCASE,
+        team1 TEXT COLLATE NOCASE,
+        team2 TEXT COLLATE NOCASE,
+        toss_winner TEXT COLLATE NOCASE,
+        toss_decision TEXT,
+        winner TEXT COLLATE NOCASE,
+        result TEXT,
+        margin TEXT
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS teams (
+        id INTEGER PRIMARY KEY,
+        name TEXT COLLATE NOCASE UNIQUE
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS players (
+        id INTEGER PRIMARY KEY,
+        name TEXT COLLATE NOCASE UNIQUE
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS deliveries (
+        match_id TEXT,
+        inning INTEGER,
+        batting_team_id INTEGER REFERENCES teams (id),
+        bowling_team_id INTEGER REFERENCES teams (id),
+        over INTEGER,
+        ball INTEGER,
+        batsman_id INTEGER REFERENCES players (id),
+        non_striker_id INTEGER REFERENCES players (id),
+        bowler_id INTEGER REFERENCES players (id),
+        runs_batsman INTEGER,
+        runs_extras INTEGER,
+        runs_total INTEGER,
+        dismissal_kind TEXT,
+        player_dismissed_id INTEGER REFERENCES players (id)
+    )
+    """)
+
+    # Parse all JSONs in /data/ across worker processes; this process is the
+    # single SQLite writer and loads everything inside one transaction
+    json_files = glob(os.path.join(DATA_DIR, "*.json"))
+    team_ids = dict(cursor.execute("SELECT name, id FROM teams"))
+    player_ids = dict(cursor.execute("SELECT name, id FROM players"))
+    with conn, Pool() as pool:
+        for match_row, rows in pool.imap_unordered(parse_match, json_files):
+            print(f"Loading: match {match_row[0]}")
+            insert_match(cursor, match_row, rows, team_ids, player_ids)
+
+    # Create indexes after the bulk load so inserts don't pay for index maintenance
+    with conn:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_match ON deliveries(match_id, inning, over, ball)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_batsman ON deliveries(batsman_id, runs_batsman)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_bowler ON deliveries(bowler_id, runs_total)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_matches_date ON matches(date)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_matches_team1 ON matches(team1)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_matches_team2 ON matches(team2)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_matches_venue ON matches(venue)")
+
+    # Summary tables so the server can read aggregates instead of scanning
+    with conn:
+        cursor.execute("DROP TABLE IF EXISTS player_stats")
+        cursor.execute("DROP TABLE IF EXISTS team_stats")
+        cursor.execute("DROP TABLE IF EXISTS venue_stats")
+        cursor.execute("""
+        CREATE TABLE player_stats (
+            name TEXT COLLATE NOCASE PRIMARY KEY,
+            matches_played INTEGER,
+            balls_faced INTEGER,
+            runs_scored INTEGER,
+            fours INTEGER,
+            sixes INTEGER,
+            boundaries INTEGER,
+            balls_bowled INTEGER,
+            runs_conceded INTEGER,
+            wickets INTEGER
+        )
+        """)
+        cursor.execute("""
+        CREATE TABLE team_stats (
+            name TEXT COLLATE NOCASE PRIMARY KEY,
+            total_matches INTEGER,
+            wins INTEGER
+        )
+        """)
+        cursor.execute("""
+        CREATE TABLE venue_stats (
+            venue TEXT COLLATE NOCASE PRIMARY KEY,
+            total_matches INTEGER,
+            team1_wins INTEGER,
+            team2_wins INTEGER,
+            teams_won TEXT,
+            first_match_date TEXT,
+            last_match_date TEXT
+        )
+        """)
+        cursor.execute("""
+        INSERT INTO player_stats
+        SELECT p.name, COUNT(DISTINCT s.match_id), SUM(s.balls_faced), SUM(s.runs_scored),
+               SUM(s.fours), SUM(s.sixes), SUM(s.boundaries),
+               SUM(s.balls_bowled), SUM(s.runs_conceded), SUM(s.wickets)
+        FROM (
+            SELECT batsman_id AS player_id, match_id, 1 AS balls_faced, runs_batsman AS runs_scored,
+                   runs_batsman = 4 AS fours, runs_batsman = 6 AS sixes, runs_batsman >= 4 AS boundaries,
+                   0 AS balls_bowled, 0 AS runs_conceded, 0 AS wickets
+            FROM deliveries
+            UNION ALL
+            SELECT bowler_id, match_id, 0, 0, 0, 0, 0, 1, runs_total, dismissal_kind != ''
+            FROM deliveries
+        ) s
+        JOIN players p ON p.id = s.player_id
+        GROUP BY s.player_id
+        """)
+        cursor.execute("""
+        INSERT INTO team_stats
+        SELECT team, COUNT(*), SUM(winner = team)
+        FROM (
+            SELECT team1 AS team, winner FROM matches
+            UNION ALL
+            SELECT team2, winner FROM matches
+        )
+        GROUP BY team
+        """)
+        cursor.execute("""
+        INSERT INTO venue_stats
+        SELECT venue, COUNT(id),
+               COUNT(CASE WHEN winner = team1 THEN 1 END),
+               COUNT(CASE WHEN winner = team2 THEN 1 END),
+               GROUP_CONCAT(DISTINCT winner),
+               MIN(date), MAX(date)
+        FROM matches
+        GROUP BY venue
+        """)
+
+    # Full-text indexes for name search, rebuilt from the loaded data
+    with conn:
+        cursor.execute("DROP TABLE IF EXISTS players_fts")
+        cursor.execute("DROP TABLE IF EXISTS teams_fts")
+        cursor.execute("DROP TABLE IF EXISTS venues_fts")
+        cursor.execute("CREATE VIRTUAL TABLE players_fts USING fts5(name, content='players', content_rowid='id')")
+        cursor.execute("CREATE VIRTUAL TABLE teams_fts USING fts5(name, content='teams', content_rowid='id')")
+        cursor.execute("CREATE VIRTUAL TABLE venues_fts USING fts5(name, city)")
+        cursor.execute("INSERT INTO players_fts (players_fts) VALUES ('rebuild')")
+        cursor.execute("INSERT INTO teams_fts (teams_fts) VALUES ('rebuild')")
+        cursor.execute("INSERT INTO venues_fts (name, city) SELECT DISTINCT venue, city FROM matches")
+
+    conn.close()
+    print("✅ All matches loaded into ipl.db")
+
+if __name__ == "__main__":
+    main()
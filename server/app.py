@@ -4,16 +4,37 @@ IPL MCP Server
 A Model Context Protocol server for IPL cricket statistics
 """
 
-import json
+import orjson
+import os
 import sqlite3
 import sys
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import asyncio
 
+import aiosqlite
+from aiosqlitepool import SQLiteConnectionPool
+
 # Add the project root to the Python path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+def log(message: str):
+    """Write a diagnostic line to stderr.
+    stdin/stdout are non-blocking while the server runs, and stderr may share
+    their file description (a terminal, or 2>&1), so write it in blocking mode."""
+    fd = sys.stderr.fileno()
+    blocking = os.get_blocking(fd)
+    os.set_blocking(fd, True)
+    try:
+        print(message, file=sys.stderr, flush=True)
+    finally:
+        os.set_blocking(fd, blocking)
+
+def fts_query(text: str) -> str:
+    """Build an FTS5 MATCH expression requiring a prefix match on every word"""
+    terms = text.replace('"', '""').split()
+    return " ".join(f'"{term}"*' for term in terms)
+
 class IPLMCPServer:
     """IPL Model Context Protocol Server"""
     
@@ -24,24 +45,119 @@ class IPLMCPServer:
             "version": "1.0.0",
             "description": "IPL Cricket Statistics MCP Server"
         }
+        self.pool = SQLiteConnectionPool(self.get_connection, pool_size=4)
+        self.tables: Optional[set] = None
+        self.table_columns: Dict[str, set] = {}
+        self.nocase_indexes: Dict[Tuple[str, str], bool] = {}
+        self.query_columns: Dict[str, List[str]] = {}
+        
+        # Static responses, built once and shared by every request
+        self.initialize_result = {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {
+                "tools": {},
+                "resources": {},
+                "prompts": {}
+            },
+            "serverInfo": self.server_info
+        }
+        self.tools_result = {
+            "tools": self.get_tools()
+        }
+    
+    async def get_connection(self) -> aiosqlite.Connection:
+        """Open a pooled database connection"""
+        # Handlers only vary their WHERE clause over a fixed set of shapes,
+        # so a larger statement cache keeps every prepared query resident
+        conn = await aiosqlite.connect(self.db_path, cached_statements=512)
+        await conn.execute("PRAGMA cache_size=-131072")
+        await conn.execute("PRAGMA mmap_size=1073741824")
+        await conn.execute("PRAGMA temp_store=MEMORY")
+        # The server never writes, so guard against accidental modification
+        await conn.execute("PRAGMA query_only=1")
+        return conn
     
-    def get_connection(self) -> sqlite3.Connection:
-        """Get database connection"""
-        return sqlite3.connect(self.db_path)
+    async def close(self):
+        """Close all pooled database connections"""
+        await self.pool.close()
     
-    def execute_query(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
-        """Execute SQL query and return results as list of dictionaries"""
+    async def execute_query(self, query: str, params: tuple = ()) -> Dict[str, Any]:
+        """Execute SQL query and return results in columnar form:
+        {"columns": [names], "rows": [value tuples]}"""
         try:
-            conn = self.get_connection()
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            results = [dict(row) for row in cursor.fetchall()]
-            conn.close()
-            return results
+            async with self.pool.connection() as conn:
+                # Column names are fixed per query text, so after the first run a
+                # query takes the single-hop execute_fetchall path with no cursor
+                columns = self.query_columns.get(query)
+                if columns is not None:
+                    rows = await conn.execute_fetchall(query, params)
+                else:
+                    async with conn.execute(query, params) as cursor:
+                        rows = await cursor.fetchall()
+                        columns = [d[0] for d in cursor.description] if cursor.description else []
+                    self.query_columns[query] = columns
+                return {"columns": columns, "rows": rows}
         except sqlite3.Error as e:
-            print(f"Database error: {e}", file=sys.stderr)
-            return []
+            log(f"Database error: {e}")
+            return {"columns": [], "rows": []}
+    
+    @staticmethod
+    def first_row(result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the first row of a columnar result as a dictionary"""
+        if not result["rows"]:
+            return None
+        return dict(zip(result["columns"], result["rows"][0]))
+    
+    async def name_filter(self, table: str, alias: str, columns: Tuple[str, ...], value: str) -> Tuple[str, List[str]]:
+        """Build a condition matching a user-supplied name against one or more columns.
+        Values containing % or _ are used as LIKE patterns as given. When every column
+        has a NOCASE index, an exact case-insensitive match is used if the name exists;
+        otherwise, or when it does not exist, a substring search is used."""
+        if "%" in value or "_" in value:
+            template, param = "{} LIKE ?", value
+        elif not all([await self.has_nocase_index(table, column) for column in columns]):
+            # Without an index the exact-match probe would be a second full scan
+            template, param = "{} LIKE ?", f"%{value}%"
+        else:
+            probe = " OR ".join(f"{column} = ? COLLATE NOCASE" for column in columns)
+            found = await self.execute_query(
+                f"SELECT 1 FROM {table} WHERE {probe} LIMIT 1", (value,) * len(columns)
+            )
+            if found["rows"]:
+                template, param = "{} = ? COLLATE NOCASE", value
+            else:
+                template, param = "{} LIKE ?", f"%{value}%"
+        
+        condition = " OR ".join(template.format(f"{alias}.{column}") for column in columns)
+        if len(columns) > 1:
+            condition = f"({condition})"
+        return condition, [param] * len(columns)
+    
+    async def has_table(self, table: str) -> bool:
+        """Check whether an optional table (FTS index, summary) was built by the data loader"""
+        if self.tables is None:
+            result = await self.execute_query("SELECT name FROM sqlite_master WHERE type = 'table'")
+            self.tables = {row[0] for row in result["rows"]}
+        return table in self.tables
+    
+    async def has_nocase_index(self, table: str, column: str) -> bool:
+        """Check whether a column leads a NOCASE index, so an exact name lookup can seek"""
+        key = (table, column)
+        if key not in self.nocase_indexes:
+            result = await self.execute_query(
+                """SELECT 1 FROM pragma_index_list(?) AS il, pragma_index_xinfo(il.name) AS ix
+                   WHERE ix.seqno = 0 AND ix.name = ? AND ix.coll = 'NOCASE' LIMIT 1""",
+                (table, column)
+            )
+            self.nocase_indexes[key] = bool(result["rows"])
+        return self.nocase_indexes[key]
+    
+    async def has_column(self, table: str, column: str) -> bool:
+        """Check whether a table has a column, as loader-built and shipped schemas differ"""
+        if table not in self.table_columns:
+            result = await self.execute_query("SELECT name FROM pragma_table_info(?)", (table,))
+            self.table_columns[table] = {row[0] for row in result["rows"]}
+        return column in self.table_columns[table]
     
     def get_tools(self) -> List[Dict[str, Any]]:
         """Get available MCP tools"""
@@ -198,30 +314,50 @@ class IPLMCPServer:
         """Get team information"""
         team_name = arguments.get('team_name')
         
+        if await self.has_table('team_stats'):
+            stats_columns = "COALESCE(ts.wins, 0) as wins, COALESCE(ts.total_matches, 0) as total_matches"
+            stats_join = "LEFT JOIN team_stats ts ON ts.name = t.name"
+            group_by = ""
+        else:
+            stats_columns = """COUNT(CASE WHEN m.winner = t.name THEN 1 END) as wins,
+                       COUNT(m.id) as total_matches"""
+            stats_join = "LEFT JOIN matches m ON (m.team1 = t.name OR m.team2 = t.name)"
+            group_by = "GROUP BY t.id"
+        
         if team_name:
-            query = """
-                SELECT t.*, COUNT(CASE WHEN m.winner = t.name THEN 1 END) as wins,
-                       COUNT(m.id) as total_matches
+            has_short_name = await self.has_column('teams', 'short_name')
+            if await self.has_table('teams_fts'):
+                name_condition = "t.id IN (SELECT rowid FROM teams_fts WHERE teams_fts MATCH ?)"
+                params = [fts_query(team_name)]
+                if has_short_name:
+                    short_condition, short_params = await self.name_filter("teams", "t", ("short_name",), team_name)
+                    name_condition = f"{name_condition} OR {short_condition}"
+                    params.extend(short_params)
+            else:
+                columns = ("name", "short_name") if has_short_name else ("name",)
+                name_condition, params = await self.name_filter("teams", "t", columns, team_name)
+            
+            query = f"""
+                SELECT t.*, {stats_columns}
                 FROM teams t
-                LEFT JOIN matches m ON (m.team1 = t.name OR m.team2 = t.name)
-                WHERE t.name LIKE ? OR t.short_name LIKE ?
-                GROUP BY t.id
+                {stats_join}
+                WHERE {name_condition}
+                {group_by}
             """
-            results = self.execute_query(query, (f"%{team_name}%", f"%{team_name}%"))
+            results = await self.execute_query(query, tuple(params))
         else:
-            query = """
-                SELECT t.*, COUNT(CASE WHEN m.winner = t.name THEN 1 END) as wins,
-                       COUNT(m.id) as total_matches
+            query = f"""
+                SELECT t.*, {stats_columns}
                 FROM teams t
-                LEFT JOIN matches m ON (m.team1 = t.name OR m.team2 = t.name)
-                GROUP BY t.id
+                {stats_join}
+                {group_by}
                 ORDER BY t.name
             """
-            results = self.execute_query(query)
+            results = await self.execute_query(query)
         
         return {
             "teams": results,
-            "total_teams": len(results)
+            "total_teams": len(results["rows"])
         }
     
     async def handle_get_player_info(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
@@ -233,33 +369,52 @@ class IPLMCPServer:
         params = []
         
         if player_name:
-            conditions.append("p.name LIKE ?")
-            params.append(f"%{player_name}%")
+            if await self.has_table('players_fts'):
+                conditions.append("p.id IN (SELECT rowid FROM players_fts WHERE players_fts MATCH ?)")
+                params.append(fts_query(player_name))
+            else:
+                condition, condition_params = await self.name_filter("players", "p", ("name",), player_name)
+                conditions.append(condition)
+                params.extend(condition_params)
         
         if team_name:
-            conditions.append("p.team LIKE ?")
-            params.append(f"%{team_name}%")
+            condition, condition_params = await self.name_filter("players", "p", ("team",), team_name)
+            conditions.append(condition)
+            params.extend(condition_params)
         
         where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
         
-        query = f"""
-            SELECT p.*, 
-                   COUNT(d.id) as total_deliveries,
-                   SUM(d.runs_batter) as total_runs,
-                   AVG(d.runs_batter) as avg_runs_per_delivery,
-                   COUNT(CASE WHEN d.runs_batter >= 4 THEN 1 END) as boundaries
-            FROM players p
-            LEFT JOIN deliveries d ON d.batter = p.name OR d.bowler = p.name
-            {where_clause}
-            GROUP BY p.id
-            ORDER BY total_runs DESC NULLS LAST, p.name
-        """
+        if await self.has_table('player_stats'):
+            query = f"""
+                SELECT p.*,
+                       ps.balls_faced + ps.balls_bowled as total_deliveries,
+                       ps.runs_scored as total_runs,
+                       CAST(ps.runs_scored AS FLOAT) / NULLIF(ps.balls_faced, 0) as avg_runs_per_delivery,
+                       ps.boundaries
+                FROM players p
+                LEFT JOIN player_stats ps ON ps.name = p.name
+                {where_clause}
+                ORDER BY total_runs DESC NULLS LAST, p.name
+            """
+        else:
+            query = f"""
+                SELECT p.*, 
+                       COUNT(d.id) as total_deliveries,
+                       SUM(d.runs_batter) as total_runs,
+                       AVG(d.runs_batter) as avg_runs_per_delivery,
+                       COUNT(CASE WHEN d.runs_batter >= 4 THEN 1 END) as boundaries
+                FROM players p
+                LEFT JOIN deliveries d ON d.batter = p.name OR d.bowler = p.name
+                {where_clause}
+                GROUP BY p.id
+                ORDER BY total_runs DESC NULLS LAST, p.name
+            """
         
-        results = self.execute_query(query, tuple(params))
+        results = await self.execute_query(query, tuple(params))
         
         return {
             "players": results,
-            "total_players": len(results)
+            "total_players": len(results["rows"])
         }
     
     async def handle_get_match_details(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
@@ -281,12 +436,14 @@ class IPLMCPServer:
             params.append(season)
         
         if team_name:
-            conditions.append("(m.team1 LIKE ? OR m.team2 LIKE ?)")
-            params.extend([f"%{team_name}%", f"%{team_name}%"])
+            condition, condition_params = await self.name_filter("matches", "m", ("team1", "team2"), team_name)
+            conditions.append(condition)
+            params.extend(condition_params)
         
         if venue:
-            conditions.append("m.venue LIKE ?")
-            params.append(f"%{venue}%")
+            condition, condition_params = await self.name_filter("matches", "m", ("venue",), venue)
+            conditions.append(condition)
+            params.extend(condition_params)
         
         where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
         
@@ -308,11 +465,11 @@ class IPLMCPServer:
             ORDER BY m.date DESC
         """
         
-        results = self.execute_query(query, tuple(params))
+        results = await self.execute_query(query, tuple(params))
         
         return {
             "matches": results,
-            "total_matches": len(results)
+            "total_matches": len(results["rows"])
         }
     
     async def handle_get_ball_by_ball(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
@@ -339,25 +496,43 @@ class IPLMCPServer:
         
         where_clause = "WHERE " + " AND ".join(conditions)
         
+        # Match columns ride along on every delivery row after a marker column,
+        # so they can be split back out without a second query whatever the
+        # matches schema looks like
         query = f"""
-            SELECT d.*, m.team1, m.team2
+            SELECT d.*, NULL AS match__, m.*
             FROM deliveries d
             JOIN matches m ON m.id = d.match_id
             {where_clause}
             ORDER BY d.innings, d.over, d.ball
         """
         
-        results = self.execute_query(query, tuple(params))
+        result = await self.execute_query(query, tuple(params))
+        rows = result["rows"]
         
-        # Get match summary
-        match_query = "SELECT * FROM matches WHERE id = ?"
-        match_info = self.execute_query(match_query, (match_id,))
+        # Everything after the marker belongs to the match; slice it off each row
+        columns = result["columns"]
+        split = columns.index("match__") if "match__" in columns else len(columns)
+        deliveries = {
+            "columns": columns[:split],
+            "rows": [row[:split] for row in rows]
+        }
+        if rows:
+            match_info = dict(zip(columns[split + 1:], rows[0][split + 1:]))
+            innings_index = deliveries["columns"].index("innings")
+            over_index = deliveries["columns"].index("over")
+            overs_covered = len(set((row[innings_index], row[over_index]) for row in rows))
+        else:
+            # No deliveries matched the filters, look the match up directly
+            match_query = "SELECT * FROM matches WHERE id = ?"
+            match_info = self.first_row(await self.execute_query(match_query, (match_id,)))
+            overs_covered = 0
         
         return {
-            "match_info": match_info[0] if match_info else None,
-            "deliveries": results,
-            "total_deliveries": len(results),
-            "overs_covered": len(set((r['innings'], r['over']) for r in results))
+            "match_info": match_info,
+            "deliveries": deliveries,
+            "total_deliveries": len(rows),
+            "overs_covered": overs_covered
         }
     
     async def handle_get_player_performance(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
@@ -370,8 +545,8 @@ class IPLMCPServer:
         
         # Batting stats
         if stat_type in ['batting', 'all']:
-            batting_conditions = ["d.batter LIKE ?"]
-            batting_params = [f"%{player_name}%"]
+            batting_condition, batting_params = await self.name_filter("deliveries", "d", ("batter",), player_name)
+            batting_conditions = [batting_condition]
             
             if match_id:
                 batting_conditions.append("d.match_id = ?")
@@ -392,13 +567,13 @@ class IPLMCPServer:
                 {batting_where}
             """
             
-            batting_results = self.execute_query(batting_query, tuple(batting_params))
-            performance['batting'] = batting_results[0] if batting_results else {}
+            batting_results = await self.execute_query(batting_query, tuple(batting_params))
+            performance['batting'] = self.first_row(batting_results) or {}
         
         # Bowling stats
         if stat_type in ['bowling', 'all']:
-            bowling_conditions = ["d.bowler LIKE ?"]
-            bowling_params = [f"%{player_name}%"]
+            bowling_condition, bowling_params = await self.name_filter("deliveries", "d", ("bowler",), player_name)
+            bowling_conditions = [bowling_condition]
             
             if match_id:
                 bowling_conditions.append("d.match_id = ?")
@@ -417,8 +592,8 @@ class IPLMCPServer:
                 {bowling_where}
             """
             
-            bowling_results = self.execute_query(bowling_query, tuple(bowling_params))
-            performance['bowling'] = bowling_results[0] if bowling_results else {}
+            bowling_results = await self.execute_query(bowling_query, tuple(bowling_params))
+            performance['bowling'] = self.first_row(bowling_results) or {}
         
         return {
             "player_name": player_name,
@@ -440,8 +615,9 @@ class IPLMCPServer:
             params.append(match_id)
         
         if official_name:
-            conditions.append("o.name LIKE ?")
-            params.append(f"%{official_name}%")
+            condition, condition_params = await self.name_filter("officials", "o", ("name",), official_name)
+            conditions.append(condition)
+            params.extend(condition_params)
         
         where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
         
@@ -453,11 +629,11 @@ class IPLMCPServer:
             ORDER BY m.date DESC, o.role, o.name
         """
         
-        results = self.execute_query(query, tuple(params))
+        results = await self.execute_query(query, tuple(params))
         
         return {
             "officials": results,
-            "total_officials": len(results)
+            "total_officials": len(results["rows"])
         }
     
     async def handle_get_venue_info(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
@@ -465,39 +641,63 @@ class IPLMCPServer:
         venue_name = arguments.get('venue_name')
         city = arguments.get('city')
         
+        # Read precomputed venue summaries when the loader built them
+        use_summary = await self.has_table('venue_stats')
+        table, alias = ("venue_stats", "v") if use_summary else ("matches", "m")
+        
         conditions = []
         params = []
         
         if venue_name:
-            conditions.append("m.venue LIKE ?")
-            params.append(f"%{venue_name}%")
+            if await self.has_table('venues_fts'):
+                conditions.append(f"{alias}.venue IN (SELECT name FROM venues_fts WHERE venues_fts MATCH ?)")
+                params.append(fts_query(venue_name))
+            else:
+                condition, condition_params = await self.name_filter(table, alias, ("venue",), venue_name)
+                conditions.append(condition)
+                params.extend(condition_params)
         
         if city:
-            conditions.append("m.venue LIKE ?")
+            conditions.append(f"{alias}.venue LIKE ?")
             params.append(f"%{city}%")
         
         where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
         
-        query = f"""
-            SELECT 
-                m.venue,
-                COUNT(m.id) as total_matches,
-                COUNT(CASE WHEN m.winner = m.team1 THEN 1 END) as team1_wins,
-                COUNT(CASE WHEN m.winner = m.team2 THEN 1 END) as team2_wins,
-                GROUP_CONCAT(DISTINCT m.winner) as teams_won,
-                MIN(m.date) as first_match_date,
-                MAX(m.date) as last_match_date
-            FROM matches m
-            {where_clause}
-            GROUP BY m.venue
-            ORDER BY total_matches DESC, m.venue
-        """
+        if use_summary:
+            query = f"""
+                SELECT 
+                    v.venue,
+                    v.total_matches,
+                    v.team1_wins,
+                    v.team2_wins,
+                    v.teams_won,
+                    v.first_match_date,
+                    v.last_match_date
+                FROM venue_stats v
+                {where_clause}
+                ORDER BY v.total_matches DESC, v.venue
+            """
+        else:
+            query = f"""
+                SELECT 
+                    m.venue,
+                    COUNT(m.id) as total_matches,
+                    COUNT(CASE WHEN m.winner = m.team1 THEN 1 END) as team1_wins,
+                    COUNT(CASE WHEN m.winner = m.team2 THEN 1 END) as team2_wins,
+                    GROUP_CONCAT(DISTINCT m.winner) as teams_won,
+                    MIN(m.date) as first_match_date,
+                    MAX(m.date) as last_match_date
+                FROM matches m
+                {where_clause}
+                GROUP BY m.venue
+                ORDER BY total_matches DESC, m.venue
+            """
         
-        results = self.execute_query(query, tuple(params))
+        results = await self.execute_query(query, tuple(params))
         
         return {
             "venues": results,
-            "total_venues": len(results)
+            "total_venues": len(results["rows"])
         }
     
     async def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
@@ -508,24 +708,14 @@ class IPLMCPServer:
             return {
                 "jsonrpc": "2.0",
                 "id": request.get("id"),
-                "result": {
-                    "protocolVersion": "2024-11-05",
-                    "capabilities": {
-                        "tools": {},
-                        "resources": {},
-                        "prompts": {}
-                    },
-                    "serverInfo": self.server_info
-                }
+                "result": self.initialize_result
             }
         
         elif method == "tools/list":
             return {
                 "jsonrpc": "2.0",
                 "id": request.get("id"),
-                "result": {
-                    "tools": self.get_tools()
-                }
+                "result": self.tools_result
             }
         
         elif method == "tools/call":
@@ -553,7 +743,7 @@ class IPLMCPServer:
                             "content": [
                                 {
                                     "type": "text",
-                                    "text": json.dumps(result, indent=2)
+                                    "text": orjson.dumps(result, option=orjson.OPT_INDENT_2).decode()
                                 }
                             ]
                         }
@@ -605,45 +795,127 @@ class IPLMCPServer:
                 }
             }
 
+class FileStreamWriter:
+    """Minimal StreamWriter stand-in for stdout redirected to a regular file"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+    
+    def write(self, data: bytes):
+        self.stream.write(data)
+    
+    async def drain(self):
+        self.stream.flush()
+
+async def open_stdio(limit: int = 2 ** 20):
+    """Wrap stdin/stdout in asyncio streams.
+    Regular files have no pipe transport; they are read or written directly."""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=limit)
+    try:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    except (ValueError, NotImplementedError):
+        reader.feed_data(sys.stdin.buffer.read())
+        reader.feed_eof()
+    
+    try:
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout)
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+    except (ValueError, NotImplementedError):
+        writer = FileStreamWriter(sys.stdout.buffer)
+    return reader, writer
+
+async def read_line(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Read one line, b"" at end of input. A line longer than the reader's
+    limit is consumed up to its newline and reported as None."""
+    overrun = False
+    while True:
+        try:
+            line = await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            line = e.partial
+        except asyncio.LimitOverrunError as e:
+            # Drop the buffered part and keep reading until the line ends
+            await reader.readexactly(e.consumed)
+            overrun = True
+            continue
+        return None if overrun else line
+
 async def main():
     """Main entry point"""
     server = IPLMCPServer()
+    # The pipe transports switch stdin/stdout to non-blocking; put them back on exit
+    # so a shared terminal isn't left that way for the shell
+    stdio_blocking = {stream.fileno(): os.get_blocking(stream.fileno()) for stream in (sys.stdin, sys.stdout)}
+    reader, writer = await open_stdio()
+    out_queue: asyncio.Queue = asyncio.Queue()
+    pending = set()
     
-    while True:
-        try:
-            line = input()
-            if not line:
+    async def write_responses():
+        """Write queued responses to stdout until the None sentinel arrives"""
+        while True:
+            message = await out_queue.get()
+            if message is None:
                 break
-                
-            request = json.loads(line)
-            response = await server.handle_request(request)
-            print(json.dumps(response))
-            sys.stdout.flush()
-            
-        except EOFError:
-            break
-        except json.JSONDecodeError:
-            error_response = {
-                "jsonrpc": "2.0",
-                "id": None,
-                "error": {
-                    "code": -32700,
-                    "message": "Parse error"
-                }
+            writer.write(message)
+            await writer.drain()
+    
+    def send(message: Dict[str, Any]):
+        out_queue.put_nowait(orjson.dumps(message) + b"\n")
+    
+    def send_error(code: int, message: str):
+        send({
+            "jsonrpc": "2.0",
+            "id": None,
+            "error": {
+                "code": code,
+                "message": message
             }
-            print(json.dumps(error_response))
-            sys.stdout.flush()
+        })
+    
+    async def handle_line(line: bytes):
+        try:
+            request = orjson.loads(line)
+            send(await server.handle_request(request))
+        except orjson.JSONDecodeError:
+            send_error(-32700, "Parse error")
         except Exception as e:
-            error_response = {
-                "jsonrpc": "2.0",
-                "id": None,
-                "error": {
-                    "code": -32603,
-                    "message": f"Internal error: {str(e)}"
-                }
-            }
-            print(json.dumps(error_response))
-            sys.stdout.flush()
+            send_error(-32603, f"Internal error: {str(e)}")
+    
+    writer_task = asyncio.create_task(write_responses())
+    try:
+        # Each request runs in its own task so slow handlers don't hold up
+        # reading the next line; responses are written in completion order
+        while True:
+            # Wait on the writer as well, so a closed stdout stops the loop at once
+            # rather than after the next line arrives
+            read_task = asyncio.create_task(read_line(reader))
+            await asyncio.wait({read_task, writer_task}, return_when=asyncio.FIRST_COMPLETED)
+            if writer_task.done():
+                read_task.cancel()
+                break
+            line = read_task.result()
+            if line is None:
+                send_error(-32700, "Parse error: request line too long")
+                continue
+            # Stop at end of input or on an empty line, as the input() loop did;
+            # anything else, whitespace included, goes to the parser
+            if not line.rstrip(b"\n"):
+                break
+            
+            task = asyncio.create_task(handle_line(line))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        
+        await asyncio.gather(*pending)
+        out_queue.put_nowait(None)
+        await writer_task
+    finally:
+        writer_task.cancel()
+        # Always release the pooled connections so their threads can exit
+        await server.close()
+        for fd, blocking in stdio_blocking.items():
+            os.set_blocking(fd, blocking)
 
 if __name__ == "__main__":
     asyncio.run(main())